@@ -1,6 +1,10 @@
 import os
+import re
 import requests
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from apify_client import ApifyClient
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
@@ -15,17 +19,23 @@ session = boto3.Session(
     aws_access_key_id=os.getenv('AWS_SERVER_PUBLIC_KEY'),
     aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'),
 )
-s3 = session.client('s3')
+# ✅ One shared (thread-safe) client, with a pool large enough for the parallel image uploads
+s3 = session.client('s3', config=Config(max_pool_connections=32, retries={"max_attempts": 3, "mode": "adaptive"}))
 bucket_name = os.getenv('AWS_BUCKET_NAME')
 aws_region = os.getenv('AWS_REGION')  # e.g., 'us-east-1'
 
+# ✅ Shared HTTP session so image downloads reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+MAX_IMAGE_WORKERS = 16
+
 # ✅ Replace with your Apify API token
 APIFY_TOKEN = os.getenv('APIFY_TOKEN')
 if not APIFY_TOKEN:
     raise ValueError("Apify API token is missing. Please set the APIFY_TOKEN environment variable.")
 
-# ✅ List of disallowed file extensions
-DISALLOWED_EXTENSIONS = [".pdf", ".xls", ".xlsx", ".doc", ".docx", ".ppt", ".pptx", ".zip", ".rar"]
+# ✅ Disallowed file extensions (also matched before a query string or fragment)
+DISALLOWED_EXTENSIONS_RE = re.compile(r"\.(pdf|xlsx?|docx?|pptx?|zip|rar)(?:[?#]|$)", re.IGNORECASE)
 
 # ✅ Initialize FastAPI App
 app = FastAPI()
@@ -38,7 +48,7 @@ class ScrapeRequest(BaseModel):
 def is_valid_url(url):
     if not url.startswith(("http://", "https://")):
         return False
-    if any(url.lower().endswith(ext) for ext in DISALLOWED_EXTENSIONS):
+    if DISALLOWED_EXTENSIONS_RE.search(url):
         return False
     return True
 
@@ -60,18 +70,21 @@ def upload_file_to_s3(file_content, s3_path, content_type="text/plain"):
 
 # ✅ Download & Upload Images to S3
 def save_and_upload_images(image_urls):
-    s3_image_urls = []
-    for idx, url in enumerate(image_urls):
+    def fetch_and_upload(idx, url):
         try:
-            response = requests.get(url)
+            response = SESSION.get(url)
             response.raise_for_status()
             file_name = f"image_{idx + 1}.jpg"
             s3_path = f"scraped_data/scraped_en_data/images/{file_name}"
-            upload_url = upload_file_to_s3(response.content, s3_path, "image/jpeg")
-            if upload_url:
-                s3_image_urls.append(upload_url)
+            return upload_file_to_s3(response.content, s3_path, "image/jpeg")
         except Exception as e:
             print(f"❌ Failed to download/upload image {url}: {e}")
+            return None
+
+    # ✅ Download & upload all images in parallel; map() keeps the original order
+    with ThreadPoolExecutor(max_workers=MAX_IMAGE_WORKERS) as executor:
+        uploads = executor.map(fetch_and_upload, range(len(image_urls)), image_urls)
+        s3_image_urls = [upload_url for upload_url in uploads if upload_url]
     return s3_image_urls
 
 # ✅ Generate Markdown Content & Upload to S3
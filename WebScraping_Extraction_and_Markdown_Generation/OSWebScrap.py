@@ -1,8 +1,18 @@
 import os
+import re
+import time
+import hashlib
+import mimetypes
 import requests
 import boto3
-from bs4 import BeautifulSoup
-from io import BytesIO
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+import lxml.html
+from lxml import etree
+from io import BytesIO, SEEK_END
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 # ✅ Load environment variables
@@ -13,22 +23,72 @@ session = boto3.Session(
     aws_access_key_id=os.getenv('AWS_SERVER_PUBLIC_KEY'),
     aws_secret_access_key=os.getenv('AWS_SERVER_SECRET_KEY'),
 )
-s3 = session.client('s3')
+# ✅ One shared (thread-safe) client, with a pool large enough for the parallel image uploads
+s3 = session.client('s3', config=Config(max_pool_connections=32, retries={"max_attempts": 3, "mode": "adaptive"}))
 bucket_name = os.getenv('AWS_BUCKET_NAME')
 aws_region = os.getenv('AWS_REGION')  # e.g., 'us-east-1'
 
-# ✅ List of disallowed file extensions
-DISALLOWED_EXTENSIONS = [".pdf", ".xls", ".xlsx", ".doc", ".docx", ".ppt", ".pptx", ".zip", ".rar"]
+# ✅ Payloads above this size are sent as parallel multipart uploads
+MULTIPART_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+# ✅ Shared HTTP session so image downloads reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+MAX_IMAGE_WORKERS = 16
+MIN_IMAGE_BYTES = 2048  # Smaller images are tracking pixels, spacers and icons
+PAGE_CACHE_TTL = 300  # Seconds a fetched page is reused (text + visual scrape of one request)
+
+# ✅ Pre-compiled XPath selectors, reused for every scraped page
+_XP_IMG = etree.XPath("//img")
+_XP_TABLE = etree.XPath("//table")
+_XP_TR = etree.XPath(".//tr")
+_XP_CELL = etree.XPath(".//td|.//th")
+_XP_VISIBLE_TEXT = etree.XPath(
+    "//body//text()[not(ancestor::script) and not(ancestor::style)]"
+)
+
+# ✅ Line boundaries (as str.splitlines) and runs of 2+ spaces separate phrases in extracted text
+_WS_RE = re.compile(r" {2,}|[\n\r\v\f\x1c-\x1e\x85\u2028\u2029]+")
+
+# ✅ Escape pipes and flatten line breaks so a cell cannot break its markdown table row
+_TABLE_ESCAPE = str.maketrans({"|": "\\|", "\n": " ", "\r": " "})
+
+# ✅ Disallowed file extensions (also matched before a query string or fragment)
+DISALLOWED_EXTENSIONS_RE = re.compile(r"\.(pdf|xlsx?|docx?|pptx?|zip|rar)(?:[?#]|$)", re.IGNORECASE)
 
 # ✅ S3 Upload Function (Consistent with PDF Processing)
 def upload_file_to_s3(file_content, s3_path, content_type="text/plain"):
     try:
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=s3_path,
-            Body=file_content,
-            ContentType=content_type,
-        )
+        # ✅ Accept raw bytes or an already-filled BytesIO buffer (sized without exporting its buffer,
+        # which would make BytesIO copy wrapped bytes)
+        if isinstance(file_content, BytesIO):
+            body = file_content
+            size = body.seek(0, SEEK_END)
+            body.seek(0)
+        else:
+            body = BytesIO(file_content)
+            size = len(file_content)
+        if size > MULTIPART_UPLOAD_THRESHOLD:
+            s3.upload_fileobj(
+                body,
+                bucket_name,
+                s3_path,
+                ExtraArgs={"ContentType": content_type},
+                Config=TRANSFER_CONFIG,
+            )
+        else:
+            s3.put_object(
+                Bucket=bucket_name,
+                Key=s3_path,
+                Body=body,
+                ContentType=content_type,
+            )
         s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_path}"
         print(f"Uploaded to S3: {s3_url}")
         return s3_url
@@ -36,76 +96,125 @@ def upload_file_to_s3(file_content, s3_path, content_type="text/plain"):
         print(f"Error uploading to S3: {e}")
         return None
 
+# ✅ Upload raw image bytes under a content-addressed key and return the S3 URL
+def upload_image(img_data, content_type=None, digest=None):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if not content_type.startswith("image/"):
+        content_type = "image/jpeg"
+    ext = mimetypes.guess_extension(content_type) or ".jpg"
+    digest = digest or hashlib.sha256(img_data).hexdigest()
+    s3_path = f"scraped_data/scraped_os_data/images/{digest}{ext}"
+    return upload_file_to_s3(img_data, s3_path, content_type)
+
+# ✅ Fetch & parse a page once per cache window; callers must treat the tree as read-only
+@lru_cache(maxsize=64)
+def _fetch_and_parse(url, window):
+    response = SESSION.get(url)
+    response.raise_for_status()
+    # ✅ Decode with the charset declared in the Content-Type header (as response.text did); without one,
+    # libxml2 would assume Latin-1 (and requests reports ISO-8859-1 for bare text/*), so use the detected encoding
+    if "charset=" in response.headers.get("Content-Type", "").lower():
+        encoding = response.encoding
+    else:
+        encoding = response.apparent_encoding
+    parser = lxml.html.HTMLParser(encoding=encoding)
+    try:
+        return lxml.html.document_fromstring(response.content, parser=parser)
+    except etree.ParserError:
+        # ✅ Empty or comment-only body: scrape it as an empty page instead of failing
+        return lxml.html.document_fromstring("<html><body></body></html>")
+
+def fetch_and_parse(url):
+    return _fetch_and_parse(url, int(time.time()) // PAGE_CACHE_TTL)
+
 # ✅ URL Validation
 def is_valid_url(url):
     if not url.startswith(("http://", "https://")):
         print("Invalid URL. Please include http:// or https://.")
         return False
 
-    if any(url.lower().endswith(ext) for ext in DISALLOWED_EXTENSIONS):
-        print(f"URL points to a disallowed file type ({url.split('.')[-1]}).")
+    disallowed = DISALLOWED_EXTENSIONS_RE.search(url)
+    if disallowed:
+        print(f"URL points to a disallowed file type ({disallowed.group(1)}).")
         return False
 
     return True
 
 # ✅ Scrape Visual Data (Images & Tables)
 def scrape_visual_data(url):
-    response = requests.get(url)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.text, "html.parser")
+    tree = fetch_and_parse(url)
 
     # ✅ Scrape & Upload Images
-    img_tags = soup.find_all("img")
-    images = []
-    for idx, img_tag in enumerate(img_tags):
-        img_url = img_tag.get("src")
-        if not img_url:
-            continue
-        img_url = requests.compat.urljoin(url, img_url)
+    img_tags = _XP_IMG(tree)
+    img_urls = [
+        requests.compat.urljoin(url, img_tag.get("src"))
+        for img_tag in img_tags
+        if img_tag.get("src")
+    ]
+    # ✅ Skip repeated URLs, inline data: URIs and SVG sprites without touching the network
+    img_urls = [
+        img_url for img_url in dict.fromkeys(img_urls)
+        if not img_url.startswith("data:")
+        and not requests.compat.urlparse(img_url).path.lower().endswith(".svg")
+    ]
 
+    def fetch(img_url):
         try:
-            img_data = requests.get(img_url).content
-            s3_path = f"scraped_data/scraped_os_data/images/image_{idx + 1}.jpg"
-            upload_url = upload_file_to_s3(img_data, s3_path, "image/jpeg")
-            if upload_url:
-                images.append(upload_url)
+            with SESSION.get(img_url, stream=True) as response:
+                response.raise_for_status()
+                # ✅ Headers arrive before the body, so reject tiny/non-raster images unread
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith("image/") or content_type.startswith("image/svg"):
+                    return None
+                if int(response.headers.get("Content-Length", MIN_IMAGE_BYTES)) < MIN_IMAGE_BYTES:
+                    return None
+                response.raw.decode_content = True
+                img_data = response.raw.read()
+                if len(img_data) < MIN_IMAGE_BYTES:
+                    return None
+                return img_data, content_type, hashlib.sha256(img_data).hexdigest()
         except Exception as e:
             print(f"Failed to download image {img_url}: {e}")
+            return None
+
+    # ✅ Download and upload share one pool; both maps keep the page order
+    with ThreadPoolExecutor(max_workers=MAX_IMAGE_WORKERS) as executor:
+        # ✅ Identical bytes served from different URLs are uploaded once
+        downloads = {}
+        for result in executor.map(fetch, img_urls):
+            if result:
+                downloads.setdefault(result[2], result)
+        uploads = executor.map(lambda result: upload_image(*result), downloads.values())
+        images = [upload_url for upload_url in uploads if upload_url]
 
     # ✅ Scrape & Upload Tables
     tables = []
-    table_text = ""
-    for table_idx, table in enumerate(soup.find_all("table"), start=1):
+    table_parts = []
+    for table_idx, table in enumerate(_XP_TABLE(tree), start=1):
         table_data = []
-        for row in table.find_all("tr"):
-            row_data = [cell.get_text(strip=True) for cell in row.find_all(["td", "th"])]
+        for row in _XP_TR(table):
+            row_data = [" ".join(cell.text_content().split()) for cell in _XP_CELL(row)]
             table_data.append(row_data)
         tables.append(table_data)
 
         # Convert table to string format
-        table_text += f"Table {table_idx}:\n"
+        table_parts.append(f"Table {table_idx}:\n")
         for row in table_data:
-            table_text += " | ".join(row) + "\n"
-        table_text += "\n"
+            table_parts.append(" | ".join(row) + "\n")
+        table_parts.append("\n")
 
     # ✅ Upload table data to S3
     table_s3_path = "scraped_data/scraped_os_data/tables.txt"
-    upload_file_to_s3(table_text.encode("utf-8"), table_s3_path, "text/plain")
+    upload_file_to_s3("".join(table_parts).encode("utf-8"), table_s3_path, "text/plain")
 
     return {"images": images, "tables": tables, "tables_s3_url": table_s3_path}
 
 # ✅ Scrape Text Data & Images, Store as Markdown
 def scrape_text_data_with_images(url):
-    response = requests.get(url)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    # ✅ Remove script and style elements
-    for script_or_style in soup(["script", "style"]):
-        script_or_style.extract()
+    tree = fetch_and_parse(url)
 
     # ✅ Extract all image references for Markdown
-    img_tags = soup.find_all("img")
+    img_tags = _XP_IMG(tree)
     image_markdown = []
     for idx, img_tag in enumerate(img_tags):
         img_url = img_tag.get("src")
@@ -114,11 +223,9 @@ def scrape_text_data_with_images(url):
             img_url = requests.compat.urljoin(url, img_url)
             image_markdown.append(f"![{alt_text}]({img_url})")
 
-    # ✅ Get visible text
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    cleaned_text = "\n".join(chunk for chunk in chunks if chunk)
+    # ✅ Get visible text (script and style contents are excluded by the XPath)
+    raw_text = "".join(_XP_VISIBLE_TEXT(tree))
+    cleaned_text = "\n".join(filter(None, (phrase.strip() for phrase in _WS_RE.split(raw_text))))
 
     # ✅ Append image references to text
     markdown_content = f"{cleaned_text}\n\n## Images\n\n" + "\n\n".join(image_markdown)
@@ -131,23 +238,27 @@ def scrape_text_data_with_images(url):
 
 # ✅ Convert Scraped Data to Final Markdown
 def convert_to_markdown(data):
-    markdown_content = "# Extracted Web Content\n\n"
-
-    # ✅ Add Images
-    markdown_content += "## Images\n\n"
-    for idx, image in enumerate(data["images"], start=1):
-        markdown_content += f"![Image {idx}]({image})\n\n"
-
-    # ✅ Add Tables
-    markdown_content += "## Tables\n\n"
-    for idx, table in enumerate(data["tables"], start=1):
-        markdown_content += f"### Table {idx}\n\n"
-        for row in table:
-            markdown_content += "| " + " | ".join(row) + " |\n"
-        markdown_content += "\n"
-
-    # ✅ Upload Final Markdown
     markdown_s3_path = "scraped_data/scraped_os_data/final_scraped_content.md"
-    upload_file_to_s3(markdown_content.encode("utf-8"), markdown_s3_path, "text/markdown")
+
+    # ✅ Encode straight into one buffer so the document is never held as both str and bytes
+    with BytesIO() as buf:
+        buf.write("# Extracted Web Content\n\n".encode("utf-8"))
+
+        # ✅ Add Images
+        buf.write("## Images\n\n".encode("utf-8"))
+        for idx, image in enumerate(data["images"], start=1):
+            buf.write(f"![Image {idx}]({image})\n\n".encode("utf-8"))
+
+        # ✅ Add Tables
+        buf.write("## Tables\n\n".encode("utf-8"))
+        for idx, table in enumerate(data["tables"], start=1):
+            buf.write(f"### Table {idx}\n\n".encode("utf-8"))
+            for row in table:
+                sanitized_row = [cell.translate(_TABLE_ESCAPE) for cell in row]
+                buf.write(("| " + " | ".join(sanitized_row) + " |\n").encode("utf-8"))
+            buf.write("\n".encode("utf-8"))
+
+        # ✅ Upload Final Markdown
+        upload_file_to_s3(buf, markdown_s3_path, "text/markdown")
     
     return markdown_s3_path
@@ -2,21 +2,29 @@ from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from typing import Dict
+from functools import lru_cache
 from pydantic import BaseModel
+import contextlib
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
+import uuid
 import boto3
+from boto3.exceptions import S3TransferFailedError
+from boto3.s3.transfer import TransferConfig
 import fitz
-import requests
 from apify_client import ApifyClient
-from botocore.exceptions import NoCredentialsError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from dotenv import load_dotenv
 from fastapi import Query
+from starlette.concurrency import run_in_threadpool
 MAX_FILE_SIZE_MB = 5  # Max allowed file size in MB
 MAX_PAGE_COUNT = 5  # Max allowed pages
 
-import time
-
 # Add the root directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from PDF_Extraction_and_Markdown_Generation.Azure_Document_Intelligence import extract_and_upload_pdf
@@ -27,7 +35,6 @@ from PDF_Extraction_and_Markdown_Generation.docklingextraction import main
 #  Now import the parsing functions
 #  Call the Docling conversion function
 # Load environment variables from .env file
-import tempfile
 load_dotenv()
 
 # AWS S3 Configuration
@@ -39,11 +46,26 @@ AWS_REGION = os.getenv("AWS_REGION")
 # Apify Configuration
 APIFY_TOKEN = os.getenv("APIFY_TOKEN")
 
+# Single shared client (thread-safe); larger pool + keep-alive so concurrent requests reuse connections
 s3_client = boto3.client(
     "s3",
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    config=Config(
+        max_pool_connections=64,
+        retries={"mode": "adaptive", "max_attempts": 5},
+        tcp_keepalive=True,
+        s3={"addressing_style": "virtual"},
+    ),
+)
+
+# Files above 8 MiB go up as parallel 16 MiB multipart parts; smaller files use a single PUT
+TRANSFER_CFG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True,
 )
 
 # Create FastAPI instance
@@ -55,6 +77,17 @@ app = FastAPI(
 class ScrapeRequest(BaseModel):
     url: str
 
+# Uploaded results and in-progress upload claims of Apify runs, keyed by run_id (oldest first).
+# Apify stays the source of truth for run status; this only avoids processing a run twice.
+enscrape_runs: Dict[str, dict] = {}
+_enscrape_runs_created: Dict[str, float] = {}
+_enscrape_runs_lock = threading.Lock()
+ENSCRAPE_RUN_TTL_SECONDS = 3600  # Cached results / claims are dropped after 1 hour
+MAX_TRACKED_ENSCRAPE_RUNS = 100  # ... or once this many newer runs exist
+# Non-terminal Apify statuses, including the transitional TIMING-OUT / ABORTING
+APIFY_PENDING_STATUSES = ("READY", "RUNNING", "TIMING-OUT", "ABORTING")
+ENSCRAPE_PROCESSING = "PROCESSING"  # Set while one poll uploads the run's results
+
 
 # Configure CORS
 app.add_middleware(
@@ -65,31 +98,174 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global storage for file details
-latest_file_details = {}
-# def generate_presigned_url(bucket, key, expiration=3600):
-#     return s3_client.generate_presigned_url(
-#         "get_object",
-#         Params={"Bucket": bucket, "Key": key},
-#         ExpiresIn=expiration
-#     )
+# Per-upload file details, keyed by the upload_id returned from /upload-pdf (oldest first)
+latest_files: Dict[str, dict] = {}
+_latest_files_created: Dict[str, float] = {}
+_latest_files_lock = threading.Lock()
+UPLOAD_TTL_SECONDS = 3600  # Uploads (details + local copy) are dropped after 1 hour
+MAX_TRACKED_UPLOADS = 100  # ... or once this many newer uploads exist
+
+def get_upload_dir(upload_id):
+    return os.path.join(os.getcwd(), "uploads", upload_id)
+
+def evict_stale_entries(entries, created_at, lock, ttl_seconds, max_entries):
+    """
+    Drop entries older than ttl_seconds, and the oldest ones beyond max_entries. Returns the evicted keys.
+    created_at holds each key's insertion time, in insertion order.
+    """
+    cutoff = time.time() - ttl_seconds
+    with lock:
+        excess = len(entries) - max_entries
+        evicted = [
+            key
+            for index, (key, created) in enumerate(created_at.items())
+            if index < excess or created < cutoff
+        ]
+        for key in evicted:
+            entries.pop(key, None)
+            created_at.pop(key, None)
+    return evicted
+
+def evict_stale_uploads():
+    """
+    Forget uploads past their TTL or beyond MAX_TRACKED_UPLOADS and delete their local folders.
+    """
+    evicted = evict_stale_entries(
+        latest_files, _latest_files_created, _latest_files_lock, UPLOAD_TTL_SECONDS, MAX_TRACKED_UPLOADS
+    )
+
+    # Disk cleanup happens outside the lock
+    for upload_id in evicted:
+        shutil.rmtree(get_upload_dir(upload_id), ignore_errors=True)
+
+def save_file_details(upload_id, file_details):
+    """
+    Track a new upload's details, evicting stale uploads to keep memory and disk bounded.
+    """
+    with _latest_files_lock:
+        latest_files[upload_id] = file_details
+        _latest_files_created[upload_id] = time.time()
+    evict_stale_uploads()
+
+def get_file_details(upload_id):
+    """
+    Look up the saved details for an upload, or raise a 404 if the upload_id is unknown or expired.
+    """
+    evict_stale_uploads()
+    with _latest_files_lock:
+        file_details = latest_files.get(upload_id)
+    if file_details is None:
+        raise HTTPException(status_code=404, detail="No file found for this upload_id. Please upload the file first.")
+    return file_details
+
+def evict_stale_enscrape_runs():
+    evict_stale_entries(
+        enscrape_runs, _enscrape_runs_created, _enscrape_runs_lock, ENSCRAPE_RUN_TTL_SECONDS, MAX_TRACKED_ENSCRAPE_RUNS
+    )
+
+def claim_enscrape_run(run_id):
+    """
+    Claim a succeeded run for uploading. Returns None if this caller should upload it, or the
+    cached result / in-progress claim if another poll already took it.
+    """
+    with _enscrape_runs_lock:
+        run_details = enscrape_runs.get(run_id)
+        if run_details is not None:
+            return run_details
+        enscrape_runs[run_id] = {"run_id": run_id, "status": ENSCRAPE_PROCESSING}
+        _enscrape_runs_created[run_id] = time.time()
+    evict_stale_enscrape_runs()
+    return None
+
+PRESIGNED_URL_EXPIRY = 3600  # 1 hour validity
+PRESIGNED_URL_WINDOW = PRESIGNED_URL_EXPIRY // 2  # URLs are reused for at most half their lifetime
+
+@lru_cache(maxsize=4096)
+def _presign(bucket, key, window):
+    return s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key},
+        ExpiresIn=PRESIGNED_URL_EXPIRY
+    )
+
+def generate_presigned_url(key):
+    """
+    Return a pre-signed GET URL for the key, reusing the same URL within a 30-minute window.
+    Stable URLs let clients cache the object; every URL handed out stays valid for 30+ minutes.
+    """
+    return _presign(S3_BUCKET, key, int(time.time()) // PRESIGNED_URL_WINDOW)
+
+@contextlib.contextmanager
+def _temp_pdf():
+    """
+    Yield a temp PDF path in the project root (same filesystem as the local copies, so it can be
+    os.replace()d into place) and remove it on exit if it is still there.
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=os.getcwd())
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def get_local_pdf_path(upload_id, filename):
+    """
+    Local path of an upload's PDF: <project root>/uploads/<upload_id>/<filename>.
+    """
+    upload_dir = get_upload_dir(upload_id)
+    os.makedirs(upload_dir, exist_ok=True)
+    return os.path.join(upload_dir, filename)
+
+def list_markdown_objects(prefix):
+    """
+    Walk every object under the prefix (paginated, so >1000 keys are covered) and keep the markdown files.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [
+        obj
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(".md")
+    ]
+
+def find_latest_markdown_folder(s3_base_folder):
+    """
+    Find the job subfolder holding the most recently modified markdown file, in a single prefix walk.
+    Returns the folder prefix and the markdown keys inside it, or (None, []) if there are none.
+    """
+    # Only markdown files that live inside a job subfolder count
+    markdown_objects = [
+        obj for obj in list_markdown_objects(s3_base_folder)
+        if "/" in obj["Key"][len(s3_base_folder):]
+    ]
+    if not markdown_objects:
+        return None, []
+
+    latest = max(markdown_objects, key=lambda obj: obj["LastModified"])
+    latest_folder = s3_base_folder + latest["Key"][len(s3_base_folder):].split("/", 1)[0] + "/"
+    markdown_files = [obj["Key"] for obj in markdown_objects if obj["Key"].startswith(latest_folder)]
+    return latest_folder, markdown_files
+
 def check_pdf_constraints(pdf_path):
     """
     Check if the PDF meets the file size and page count constraints.
     """
     try:
-        # Get file size
+        # Get file size (a single stat call, so oversized files are rejected before any PDF parsing)
         pdf_size_mb = os.path.getsize(pdf_path) / (1024 * 1024)  # Convert bytes to MB
 
-        # Get page count
-        with fitz.open(pdf_path) as pdf_doc:
-            pdf_page_count = len(pdf_doc)
-
         if pdf_size_mb > MAX_FILE_SIZE_MB:
             error_message = f"❌ File too large: {pdf_size_mb:.2f}MB (Limit: {MAX_FILE_SIZE_MB}MB). Process stopped."
             print(error_message)
             return {"error": error_message}  # Return error instead of raising
 
+        # Get page count
+        with fitz.open(pdf_path, filetype="pdf") as pdf_doc:
+            pdf_page_count = pdf_doc.page_count
+
         if pdf_page_count > MAX_PAGE_COUNT:
             error_message = f"❌ Too many pages: {pdf_page_count} pages (Limit: {MAX_PAGE_COUNT} pages). Process stopped."
             print(error_message)
@@ -129,106 +305,107 @@ async def upload_pdf(file: UploadFile = File(...), service_type: str = Query("")
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    if not file.filename:
+    # Keep only the final path component of the client-supplied name (no "../" or absolute paths)
+    filename = os.path.basename((file.filename or "").replace("\\", "/"))
+    if filename in ("", ".", ".."):
         raise HTTPException(status_code=400, detail="Uploaded file has no name")
 
     if not S3_BUCKET:
         raise HTTPException(status_code=500, detail="S3_BUCKET environment variable is missing")
     
-    temp_pdf_path = None  # Define temp path for cleanup
-
     try:
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-            temp_pdf.write(file.file.read())
-            temp_pdf_path = temp_pdf.name
-
-        # Check PDF constraints for only Enterprise service type
-        if service_type == "Enterprise":
-            constraint_check = check_pdf_constraints(temp_pdf_path)
-            if "error" in constraint_check:
-                os.remove(temp_pdf_path)  # Cleanup temp file
-                raise HTTPException(status_code=400, detail=constraint_check["error"])
-
-        # Upload file to S3 (only if constraints are met)
-        s3_key = f"RawInputs/{file.filename}"
-        s3_client.upload_file(temp_pdf_path, S3_BUCKET, s3_key)
-
-        # Generate pre-signed URL
-        file_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET, 'Key': s3_key},
-            ExpiresIn=3600  # 1 hour validity
-        )
-
-        # Cleanup: Delete the temp file after successful upload
-        os.remove(temp_pdf_path)
-
-        # Save the file details globally
-        global latest_file_details
-        latest_file_details = {
-            "filename": file.filename,
+        # Save the uploaded file temporarily (streamed in 1 MiB chunks, off the event loop).
+        # The temp file is always removed on exit unless it was moved into place as the local copy.
+        with _temp_pdf() as temp_pdf_path:
+            with open(temp_pdf_path, "wb") as temp_pdf:
+                await run_in_threadpool(shutil.copyfileobj, file.file, temp_pdf, 1 << 20)
+
+            # Check PDF constraints for only Enterprise service type
+            if service_type == "Enterprise":
+                constraint_check = await run_in_threadpool(check_pdf_constraints, temp_pdf_path)
+                if "error" in constraint_check:
+                    raise HTTPException(status_code=400, detail=constraint_check["error"])
+
+            # Upload file to S3 (only if constraints are met), off the event loop
+            s3_key = f"RawInputs/{filename}"
+            with open(temp_pdf_path, "rb") as pdf_file:
+                await run_in_threadpool(s3_client.upload_fileobj, pdf_file, S3_BUCKET, s3_key, Config=TRANSFER_CFG)
+
+            # Generate pre-signed URL
+            file_url = generate_presigned_url(s3_key)
+
+            # Keep the uploaded bytes as the local copy so parsing doesn't re-download them from S3.
+            # Each upload gets its own folder so concurrent uploads of the same filename don't collide.
+            upload_id = uuid.uuid4().hex
+            local_path = get_local_pdf_path(upload_id, filename)
+            os.replace(temp_pdf_path, local_path)
+
+        # Save the file details for this upload (eviction may delete old upload folders, so off the event loop)
+        await run_in_threadpool(save_file_details, upload_id, {
+            "upload_id": upload_id,
+            "filename": filename,
             "file_url": file_url,
             "s3_key": s3_key,
-        }
+            "local_path": local_path,
+        })
 
-        return {"filename": file.filename, "message": "✅ PDF uploaded successfully!", "file_url": file_url}
+        return {"upload_id": upload_id, "filename": filename, "message": "✅ PDF uploaded successfully!", "file_url": file_url}
 
     except NoCredentialsError:
-        if temp_pdf_path and os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)  # Cleanup on error
         raise HTTPException(status_code=500, detail="AWS credentials not found")
-    except HTTPException as e:
-        if temp_pdf_path and os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)  # Cleanup on error
-        raise e
+    except HTTPException:
+        raise
     except Exception as e:
-        if temp_pdf_path and os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)  # Cleanup on error
         raise HTTPException(status_code=500, detail=f"❌ Upload failed: {str(e)}")
         
 @app.get("/get-latest-file-url")
-async def get_latest_file_url() -> Dict[str, str]:
+async def get_latest_file_url(upload_id: str = Query(...)) -> Dict[str, str]:
     """
-    Retrieve the most recently uploaded file's URL, download it locally, and save the details.
+    Retrieve the uploaded file's URL, download it locally, and save the details.
+    The download is skipped when the local copy kept by /upload-pdf is still on disk.
     """
-    if not latest_file_details:
-        raise HTTPException(status_code=404, detail="No files have been uploaded yet")
+    file_details = await run_in_threadpool(get_file_details, upload_id)
+
+    local_path = file_details.get("local_path")
+    if local_path and os.path.exists(local_path) and os.path.getsize(local_path) > 0:
+        return file_details
 
     # Define local download path
-    project_root = os.getcwd()
-    downloaded_pdf_path = os.path.join(project_root, latest_file_details["filename"])
+    downloaded_pdf_path = get_local_pdf_path(upload_id, file_details["filename"])
 
-    # Download the file
+    # Download the file straight from S3 (streamed to disk, parallel ranged GETs for large files).
+    # It goes to a temp file first, so a failed download never leaves a truncated PDF at the local path.
     try:
-        response = requests.get(latest_file_details["file_url"])
-        response.raise_for_status()
-        with open(downloaded_pdf_path, "wb") as pdf_file:
-            pdf_file.write(response.content)
+        with _temp_pdf() as temp_pdf_path:
+            with open(temp_pdf_path, "wb") as pdf_file:
+                await run_in_threadpool(
+                    s3_client.download_fileobj, S3_BUCKET, file_details["s3_key"], pdf_file, Config=TRANSFER_CFG
+                )
+            os.replace(temp_pdf_path, downloaded_pdf_path)
         print(f"[INFO] PDF downloaded successfully: {downloaded_pdf_path}")
 
-        # Update the local path in the global file details
-        latest_file_details["local_path"] = downloaded_pdf_path
+        # Update the local path in this upload's file details
+        with _latest_files_lock:
+            file_details["local_path"] = downloaded_pdf_path
 
-    except requests.exceptions.RequestException as e:
+    except (BotoCoreError, ClientError, S3TransferFailedError) as e:
         raise HTTPException(status_code=500, detail=f"Failed to download PDF: {str(e)}")
 
-    return latest_file_details
+    return file_details
 
 
 @app.get("/parse-pdf")
-async def parse_uploaded_pdf():
+def parse_uploaded_pdf(upload_id: str = Query(...)):
     """
-    Uses the saved latest file details to extract content and upload results to S3.
+    Uses the saved file details of the upload to extract content and upload results to S3.
     """
     try:
-        # Check if the latest file details are available
-        if not latest_file_details:
-            raise HTTPException(status_code=404, detail="No file has been downloaded yet. Please fetch the latest file first.")
+        # Check if the file details for this upload are available
+        file_details = get_file_details(upload_id)
 
         # Extract the details from the saved data
-        local_path = latest_file_details.get("local_path")
-        filename = latest_file_details.get("filename")
+        local_path = file_details.get("local_path")
+        filename = file_details.get("filename")
 
         if not local_path or not filename:
             raise HTTPException(status_code=404, detail="Incomplete file details. Please fetch the latest file again.")
@@ -249,16 +426,15 @@ async def parse_uploaded_pdf():
         raise HTTPException(status_code=500, detail=f"Parsing failed: {str(e)}")
 
 @app.get("/parse-pdf-azure")
-async def parse_uploaded_pdf_azure():
+def parse_uploaded_pdf_azure(upload_id: str = Query(...)):
     """
-    Uses the saved latest file details to extract content using Azure Document Intelligence.
+    Uses the saved file details of the upload to extract content using Azure Document Intelligence.
     """
     try:
-        if not latest_file_details:
-            raise HTTPException(status_code=404, detail="No file has been downloaded yet. Please fetch the latest file first.")
+        file_details = get_file_details(upload_id)
 
-        local_path = latest_file_details.get("local_path")
-        filename = latest_file_details.get("filename")
+        local_path = file_details.get("local_path")
+        filename = file_details.get("filename")
 
         if not local_path or not filename:
             raise HTTPException(status_code=404, detail="Incomplete file details. Please fetch the latest file again.")
@@ -276,16 +452,15 @@ async def parse_uploaded_pdf_azure():
         raise HTTPException(status_code=500, detail=f"Azure PDF Processing failed: {str(e)}")
     
 @app.get("/convert-pdf-markdown")
-async def convert_pdf_to_markdown_api(service_type: str = Query("Open Source")):
+def convert_pdf_to_markdown_api(upload_id: str = Query(...), service_type: str = Query("Open Source")):
     """
-    Uses the saved latest file details to convert the PDF into markdown using Docling.
+    Uses the saved file details of the upload to convert the PDF into markdown using Docling.
     """
     try:
-        if not latest_file_details:
-            raise HTTPException(status_code=404, detail="No file has been downloaded yet. Please fetch the latest file first.")
+        file_details = get_file_details(upload_id)
 
-        local_path = latest_file_details.get("local_path")
-        filename = latest_file_details.get("filename")
+        local_path = file_details.get("local_path")
+        filename = file_details.get("filename")
 
         if not local_path or not filename:
             raise HTTPException(status_code=404, detail="Incomplete file details. Please fetch the latest file again.")
@@ -304,7 +479,7 @@ async def convert_pdf_to_markdown_api(service_type: str = Query("Open Source")):
         raise HTTPException(status_code=500, detail=f"Docling Markdown conversion failed: {str(e)}")
     
 @app.get("/fetch-latest-markdown-urls")
-async def fetch_latest_markdown_from_s3():
+def fetch_latest_markdown_from_s3():
     """
     Fetch Markdown file URLs from the latest job-specific subfolder in S3.
     """
@@ -312,47 +487,15 @@ async def fetch_latest_markdown_from_s3():
         # Base folder where markdowns are stored
         s3_base_folder = "pdf_processing_pipeline/markdown_outputs/"
 
-        # Fetch all objects under markdown_outputs
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=s3_base_folder, Delimiter='/')
-
-        if "CommonPrefixes" not in response:
-            raise HTTPException(status_code=404, detail="No markdown folders found in S3.")
-
-        # Extract all job-specific subfolders
-        subfolders = [prefix["Prefix"] for prefix in response["CommonPrefixes"]]
-
-        if not subfolders:
-            raise HTTPException(status_code=404, detail="No markdown subfolders found in S3.")
-
-        # Fetch last modified markdown file inside each subfolder
-        latest_folder = None
-        latest_time = None
-
-        for folder in subfolders:
-            # List files inside each subfolder
-            folder_response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=folder)
-
-            if "Contents" not in folder_response:
-                continue
-
-            # Get the latest modified file inside the folder
-            for obj in folder_response["Contents"]:
-                if obj["Key"].endswith(".md"):
-                    last_modified = obj["LastModified"]
-
-                    if latest_time is None or last_modified > latest_time:
-                        latest_folder = folder
-                        latest_time = last_modified
+        # Find the latest job subfolder and its markdown files in one paginated walk
+        latest_folder, markdown_files = find_latest_markdown_folder(s3_base_folder)
 
         if latest_folder is None:
             raise HTTPException(status_code=404, detail="No markdown files found in subfolders.")
 
-        # Fetch all markdown files inside the latest folder
-        latest_folder_response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=latest_folder)
         markdown_urls = [
-            f"https://{S3_BUCKET}.s3.amazonaws.com/{obj['Key']}"
-            for obj in latest_folder_response["Contents"]
-            if obj["Key"].endswith(".md")
+            f"https://{S3_BUCKET}.s3.amazonaws.com/{file_key}"
+            for file_key in markdown_files
         ]
 
         return {
@@ -366,7 +509,7 @@ async def fetch_latest_markdown_from_s3():
     
 
 @app.get("/fetch-latest-markdown-downloads")
-async def fetch_latest_markdown_downloads():
+def fetch_latest_markdown_downloads():
     """
     Fetch Markdown file download links from the latest job-specific folder in S3.
     """
@@ -374,46 +517,12 @@ async def fetch_latest_markdown_downloads():
         # Base S3 folder where markdowns are stored
         s3_base_folder = "pdf_processing_pipeline/markdown_outputs/"
 
-        # Fetch all job subfolders
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=s3_base_folder, Delimiter='/')
-
-        if "CommonPrefixes" not in response:
-            raise HTTPException(status_code=404, detail="No markdown folders found in S3.")
-
-        # Extract all subfolders
-        subfolders = [prefix["Prefix"] for prefix in response["CommonPrefixes"]]
-
-        if not subfolders:
-            raise HTTPException(status_code=404, detail="No markdown subfolders found in S3.")
-
-        # Find the latest folder based on the most recently modified file
-        latest_folder = None
-        latest_time = None
-
-        for folder in subfolders:
-            folder_response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=folder)
-
-            if "Contents" not in folder_response:
-                continue
-
-            # Check the latest file modification time inside each subfolder
-            for obj in folder_response["Contents"]:
-                if obj["Key"].endswith(".md"):
-                    last_modified = obj["LastModified"]
-
-                    if latest_time is None or last_modified > latest_time:
-                        latest_folder = folder
-                        latest_time = last_modified
+        # Find the latest job subfolder and its markdown files in one paginated walk
+        latest_folder, markdown_files = find_latest_markdown_folder(s3_base_folder)
 
         if latest_folder is None:
             raise HTTPException(status_code=404, detail="No markdown files found in subfolders.")
 
-        # ✅ List all Markdown files inside the latest folder
-        latest_folder_response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=latest_folder)
-        markdown_files = [
-            obj["Key"] for obj in latest_folder_response["Contents"] if obj["Key"].endswith(".md")
-        ]
-
         if not markdown_files:
             raise HTTPException(status_code=404, detail="No markdown files available for download.")
 
@@ -421,11 +530,7 @@ async def fetch_latest_markdown_downloads():
         markdown_download_links = []
         for file_key in markdown_files:
             # ✅ Option 1: Use pre-signed URL for private files (recommended for security)
-            download_url = s3_client.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": S3_BUCKET, "Key": file_key},
-                ExpiresIn=3600 
-            )
+            download_url = generate_presigned_url(file_key)
 
             # ✅ Option 2: Use direct public URL (if ACL is `public-read`)
             # download_url = f"https://{S3_BUCKET}.s3.amazonaws.com/{file_key}"
@@ -446,7 +551,7 @@ async def fetch_latest_markdown_downloads():
     
 @app.post("/enscrape")
 def scrape_webpage(request: ScrapeRequest):
-    """Scrape a webpage using Apify and upload the results to S3."""
+    """Start an Apify scrape of a webpage; poll /enscrape/status/{run_id} for the S3 results."""
     if not is_valid_url(request.url):
         raise HTTPException(status_code=400, detail="Invalid URL or unsupported file type.")
  
@@ -473,28 +578,77 @@ def scrape_webpage(request: ScrapeRequest):
         # Initialize Apify client
         client = ApifyClient(APIFY_TOKEN)
  
-        # Run the Apify actor
-        run = client.actor(actor_id).call(run_input=input_data)
- 
-        # Fetch the results
-        dataset_id = run["defaultDatasetId"]
-        items = client.dataset(dataset_id).list_items().items
- 
-        # Process the results
-        for item in items:
-            images = item.get("images", [])
-            text = item.get("text", "")
-            s3_image_urls = save_and_upload_images(images)
-            md_s3_url = generate_and_upload_markdown(text, s3_image_urls)
-            return {"markdown_s3_url": md_s3_url}
+        # Start the Apify actor without waiting for it; clients poll /enscrape/status/{run_id}
+        run = client.actor(actor_id).start(run_input=input_data)
+
+        return {"run_id": run["id"], "status": run["status"]}
  
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@app.get("/enscrape/status/{run_id}")
+def scrape_webpage_status(run_id: str):
+    """
+    Check an Apify run started by /enscrape; once it has succeeded, upload its results to S3.
+    Runs this process has no record of (restart, another instance) are looked up in Apify directly.
+    """
+    # Results were already uploaded on an earlier poll, or another poll is uploading them now
+    evict_stale_enscrape_runs()
+    with _enscrape_runs_lock:
+        run_details = enscrape_runs.get(run_id)
+    if run_details is not None:
+        return run_details
+
+    try:
+        client = ApifyClient(APIFY_TOKEN)
+        run = client.run(run_id).get()
+        if run is None:
+            raise HTTPException(status_code=404, detail="Apify run not found.")
+
+        if run["status"] in APIFY_PENDING_STATUSES:
+            return {"run_id": run_id, "status": run["status"]}
+
+        if run["status"] != "SUCCEEDED":
+            raise HTTPException(status_code=500, detail=f"Apify run finished with status {run['status']}.")
+
+        # Claim the upload so overlapping polls don't process the same run twice
+        run_details = claim_enscrape_run(run_id)
+        if run_details is not None:
+            return run_details
+
+        try:
+            # Only the first scraped page is turned into markdown (it is written to a fixed S3 key),
+            # so fetch just that one item instead of the whole dataset
+            for item in client.dataset(run["defaultDatasetId"]).iterate_items(limit=1):
+                images = item.get("images", [])
+                text = item.get("text", "")
+                s3_image_urls = save_and_upload_images(images)
+                md_s3_url = generate_and_upload_markdown(text, s3_image_urls)
+
+                run_details = {"run_id": run_id, "status": run["status"], "markdown_s3_url": md_s3_url}
+                with _enscrape_runs_lock:
+                    enscrape_runs[run_id] = run_details
+                    _enscrape_runs_created.setdefault(run_id, time.time())  # The claim may have been evicted meanwhile
+                return run_details
+
+            raise HTTPException(status_code=404, detail="Apify run produced no results.")
+        except Exception:
+            # Release the claim so a later poll can retry the upload
+            with _enscrape_runs_lock:
+                enscrape_runs.pop(run_id, None)
+                _enscrape_runs_created.pop(run_id, None)
+            raise
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
     
 
 
 @app.post("/OpenSourceWebscrape/")
-async def scrape_url(scrape_request: ScrapeRequest):
+def scrape_url(scrape_request: ScrapeRequest):
     url = scrape_request.url
  
     if not is_valid_url(url):
@@ -516,7 +670,7 @@ async def scrape_url(scrape_request: ScrapeRequest):
     }
 
 @app.get("/fetch-WebScrapMarkdowns")
-async def fetch_WebScrapMarkdowns_from_s3(service_type: str = Query(...)):
+def fetch_WebScrapMarkdowns_from_s3(service_type: str = Query(...)):
     """
     Fetch the latest Markdown file from the correct S3 folder based on service type.
     """
@@ -529,33 +683,17 @@ async def fetch_WebScrapMarkdowns_from_s3(service_type: str = Query(...)):
         else:
             raise HTTPException(status_code=400, detail="Invalid service type! Choose 'Open Source' or 'Enterprise'.")
 
-        # ✅ Fetch all files in the selected folder
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=s3_folder)
+        # ✅ Walk every markdown file in the selected folder (paginated)
+        markdown_objects = list_markdown_objects(s3_folder)
 
-        if "Contents" not in response or len(response["Contents"]) == 0:
+        if not markdown_objects:
             raise HTTPException(status_code=404, detail=f"No markdown files found in S3 for {service_type}.")
 
         # ✅ Get the latest markdown file
-        latest_file = None
-        latest_time = None
-
-        for obj in response["Contents"]:
-            if obj["Key"].endswith(".md"):  # ✅ Process Markdown files
-                last_modified = obj["LastModified"]
-
-                if latest_time is None or last_modified > latest_time:
-                    latest_file = obj["Key"]
-                    latest_time = last_modified
-
-        if latest_file is None:
-            raise HTTPException(status_code=404, detail=f"No markdown files found in {service_type} folder.")
+        latest_file = max(markdown_objects, key=lambda obj: obj["LastModified"])["Key"]
 
         # ✅ Generate pre-signed URL for download
-        download_url = s3_client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": S3_BUCKET, "Key": latest_file},
-            ExpiresIn=3600  # 1-hour expiration
-        )
+        download_url = generate_presigned_url(latest_file)
 
         return {
             "message": f"Fetched latest markdown file for {service_type}.",
@@ -33,6 +33,9 @@ FETCH_MARKDOWN_API = f"{FASTAPI_URL}/fetch-latest-markdown-urls"
 FETCH_DOWNLOADABLE_MARKDOWN_API = f"{FASTAPI_URL}/fetch-latest-markdown-downloads"
 SCRAPE_OS_API = f"{FASTAPI_URL}/OpenSourceWebscrape/"
 SCRAPE_EN_API = f"{FASTAPI_URL}/enscrape"
+SCRAPE_EN_STATUS_API = f"{FASTAPI_URL}/enscrape/status"
+ENSCRAPE_POLL_INTERVAL = 5  # Seconds between Apify run status checks
+ENSCRAPE_MAX_POLLS = 120  # Give up after ~10 minutes
 FETCH_WEB_MARKDOWN_API = f"{FASTAPI_URL}/fetch-WebScrapMarkdowns"
 
 uploaded_file = None  # Define uploaded_file globally
@@ -72,7 +75,9 @@ def upload_pdf(file):
 
         if response.status_code == 200:
             st.session_state.file_uploaded = True
-            return response.json()
+            upload_response = response.json()
+            st.session_state.upload_id = upload_response.get("upload_id")  # ✅ Identifies this upload in later calls
+            return upload_response
         else:
             try:
                 error_detail = response.json().get("detail", f"Upload failed: {response.status_code}")
@@ -92,14 +97,15 @@ def process_open_source_pdf():
                 time.sleep(1)
                 progress_bar.progress((i + 1) * 10)  # Update progress
 
+            upload_params = {"upload_id": st.session_state.get("upload_id")}
             # Step 1: Get Latest File URL
-            response_latest = requests.get(LATEST_FILE_API)
+            response_latest = requests.get(LATEST_FILE_API, params=upload_params)
             if response_latest.status_code != 200:
                 progress_bar.empty()
                 return {"error": f"❌ Failed to fetch latest file URL: {response_latest.text}"}
 
             # Step 2: Parse the PDF
-            response_parse = requests.get(PARSE_PDF_API, timeout=600)  # Increased timeout
+            response_parse = requests.get(PARSE_PDF_API, params=upload_params, timeout=600)  # Increased timeout
             if response_parse.status_code == 200:
                 st.session_state.extraction_complete = True
                 progress_bar.empty()
@@ -120,13 +126,14 @@ def process_azure_pdf():
             for i in range(10):  # Simulate progress while waiting
                 time.sleep(1)
                 progress_bar.progress((i + 1) * 10)
+            upload_params = {"upload_id": st.session_state.get("upload_id")}
              # Step 1: Get Latest File URL
-            response_latest = requests.get(LATEST_FILE_API)
+            response_latest = requests.get(LATEST_FILE_API, params=upload_params)
             if response_latest.status_code != 200:
                 progress_bar.empty()
                 return {"error": f"❌ Failed to fetch latest file URL: {response_latest.text}"}
 
-            response = requests.get(PARSE_PDF_AZURE_API, timeout=600)  # Increased timeout
+            response = requests.get(PARSE_PDF_AZURE_API, params=upload_params, timeout=600)  # Increased timeout
 
             if response.status_code == 200:
                 st.session_state.extraction_complete = True
@@ -151,14 +158,15 @@ def convert_to_markdown():
                 progress_bar.progress((i + 1) * 10)
 
             service_type = st.session_state.get("service_type", None)
+            upload_id = st.session_state.get("upload_id")
             # Step 1: Get Latest File URL
-            response_latest = requests.get(LATEST_FILE_API,params={"service_type": service_type})
+            response_latest = requests.get(LATEST_FILE_API,params={"upload_id": upload_id, "service_type": service_type})
             if response_latest.status_code != 200:
                 progress_bar.empty()
                 return {"error": f"❌ Failed to fetch latest file URL: {response_latest.text}"}
 
             # Step 2: Convert PDF to Markdown
-            response = requests.get(CONVERT_MARKDOWN_API)
+            response = requests.get(CONVERT_MARKDOWN_API, params={"upload_id": upload_id})
             if response.status_code == 200:
                 st.session_state.markdown_ready = True
                 progress_bar.empty()
@@ -308,14 +316,28 @@ def en_scrape_url(url):
                 params={"service_type": service_type}  # ✅ Send service_type dynamically
             )
 
-            progress_bar.empty()
-
-            if response.status_code == 200:
-                st.session_state["last_service_type"] = service_type  # ✅ Store service_type after extraction
-                return response.json()
-            else:
+            if response.status_code != 200:
+                progress_bar.empty()
                 return {"error": f"Failed to scrape URL. Status code: {response.status_code}"}
 
+            # ✅ The Apify run is started asynchronously; poll until it has finished
+            run_id = response.json().get("run_id")
+            for _ in range(ENSCRAPE_MAX_POLLS):
+                response = requests.get(f"{SCRAPE_EN_STATUS_API}/{run_id}")
+                if response.status_code != 200:
+                    progress_bar.empty()
+                    return {"error": f"Failed to scrape URL. Status code: {response.status_code}"}
+
+                status_response = response.json()
+                if "markdown_s3_url" in status_response:
+                    progress_bar.empty()
+                    st.session_state["last_service_type"] = service_type  # ✅ Store service_type after extraction
+                    return status_response
+                time.sleep(ENSCRAPE_POLL_INTERVAL)
+
+            progress_bar.empty()
+            return {"error": "⚠️ Scraping is taking too long. Please try again later."}
+
         except requests.RequestException as e:
             progress_bar.empty()
             return {"error": str(e)}